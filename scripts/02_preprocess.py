@@ -1,8 +1,14 @@
 import os
+import sys
 import yaml
 import numpy as np
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.cube import CUBE_DIR, publish_cube, write_cube  # noqa: E402
+from src.engine import import_polars  # noqa: E402
+from src.ranks import write_rank_index  # noqa: E402
+
 
 # ---------------------------
 # utils: winsorize + zscore
@@ -47,10 +53,10 @@ def compute_factors(panel: pd.DataFrame) -> pd.DataFrame:
     df = panel.sort_values(["ticker", "date"]).copy()
     g = df.groupby("ticker", group_keys=False)
 
-    # Momentum / reversal
-    df["mom_20"] = g["adj_close"].pct_change(20)
-    df["mom_60"] = g["adj_close"].pct_change(60)
-    df["rev_5"]  = -g["adj_close"].pct_change(5)
+    # Momentum / reversal (fill_method=None: no forward-fill of price gaps on any pandas version)
+    df["mom_20"] = g["adj_close"].pct_change(20, fill_method=None)
+    df["mom_60"] = g["adj_close"].pct_change(60, fill_method=None)
+    df["rev_5"]  = -g["adj_close"].pct_change(5, fill_method=None)
 
     # Volatility: rolling std of daily returns
     df["vol_20"] = (
@@ -83,6 +89,54 @@ def compute_factors(panel: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+# ---------------------------
+# polars backend (lazy, multithreaded)
+# ---------------------------
+def build_panel_factors_polars(in_path: str, out_path: str, factor_cols, horizons, min_hist: int, winsor_pct: float):
+    """
+    Same steps as the pandas path (factors -> history/label filters -> winsorize + zscore per date),
+    expressed as one lazy query over the parquet file and streamed to out_path.
+    """
+    pl = import_polars()
+
+    px = pl.col("adj_close")
+    dollar_vol = pl.col("close") * pl.col("volume")
+    dollar_vol = pl.when(dollar_vol != 0).then(dollar_vol)
+    amihud_daily = pl.col("ret_1d").abs() / dollar_vol
+    vol_mean_20 = pl.col("volume").rolling_mean(20, min_samples=20).over("ticker")
+
+    lf = pl.scan_parquet(in_path).sort(["ticker", "date"])
+
+    # 1) compute factors (NaN -> null so missing values behave like pandas NaN downstream)
+    lf = lf.with_columns(
+        (px / px.shift(20) - 1.0).over("ticker").alias("mom_20"),
+        (px / px.shift(60) - 1.0).over("ticker").alias("mom_60"),
+        (-(px / px.shift(5) - 1.0)).over("ticker").alias("rev_5"),
+        pl.col("ret_1d").rolling_std(20, min_samples=20).over("ticker").alias("vol_20"),
+        amihud_daily.rolling_mean(20, min_samples=20).over("ticker").alias("amihud_20"),
+        (pl.col("volume") / vol_mean_20 - 1.0).alias("volu_z_20"),
+        (pl.int_range(pl.len()).over("ticker") >= min_hist).alias("hist_ok"),
+    ).with_columns(pl.col(factor_cols).fill_nan(None))
+
+    # 2) + 3) filters: enough history, all forward-return labels exist
+    keep = pl.col("hist_ok")
+    for h in horizons:
+        keep = keep & pl.col(f"fwd_ret_{h}d").is_not_null() & pl.col(f"fwd_ret_{h}d").is_not_nan()
+    lf = lf.filter(keep).drop("hist_ok")
+
+    # 4) cross-sectional preprocess (winsorize + zscore each date)
+    def winsor_zscore(col):
+        x = pl.col(col)
+        x = x.clip(x.quantile(winsor_pct, "linear"), x.quantile(1 - winsor_pct, "linear"))
+        sd = x.std(ddof=0)
+        return pl.when(sd != 0).then((x - x.mean()) / sd).over("date").alias(col)
+
+    lf = lf.with_columns([winsor_zscore(c) for c in factor_cols]).sort(["date", "ticker"])
+
+    # 5) save
+    lf.sink_parquet(out_path)
+
+
 def main():
     # 0) load config
     with open("config.yaml", "r") as f:
@@ -91,18 +145,39 @@ def main():
     winsor_pct = cfg["research"]["winsor_pct"]
     min_hist = cfg["research"]["min_history_days"]
     horizons = cfg["research"]["horizons"]
+    backend = cfg.get("engine", {}).get("backend", "pandas")
+    if backend not in ("pandas", "polars"):
+        raise ValueError(f"Unknown engine.backend={backend!r}; expected 'pandas' or 'polars'.")
 
     in_path = "data/processed/panel.parquet"
     if not os.path.exists(in_path):
         raise FileNotFoundError(f"Missing {in_path}. Run scripts/01_build_panel.py first.")
 
+    factor_cols = ["mom_20", "mom_60", "rev_5", "vol_20", "amihud_20", "volu_z_20"]
+    cube_fields = factor_cols + [f"fwd_ret_{h}d" for h in horizons]
+    os.makedirs("data/processed", exist_ok=True)
+    out_path = "data/processed/panel_factors.parquet"
+
+    if backend == "polars":
+        pl = import_polars()
+        build_panel_factors_polars(in_path, out_path, factor_cols, horizons, min_hist, winsor_pct)
+        n = pl.scan_parquet(out_path).select(
+            pl.len().alias("rows"),
+            pl.col("ticker").n_unique().alias("tickers"),
+            pl.col("date").n_unique().alias("dates"),
+        ).collect().row(0, named=True)
+        build_dir = write_cube(pd.read_parquet(out_path, columns=["date", "ticker"] + cube_fields), cube_fields, CUBE_DIR)
+        write_rank_index(build_dir)
+        publish_cube(build_dir, CUBE_DIR)
+        print(f"[OK] saved: {out_path} | rows={n['rows']:,} | tickers={n['tickers']} | dates={n['dates']} | backend=polars")
+        print(f"[OK] saved: {CUBE_DIR} (+ rank index) | fields={len(cube_fields)}")
+        return
+
     panel = pd.read_parquet(in_path)
 
     # 1) compute factors
     panel = compute_factors(panel)
 
-    factor_cols = ["mom_20", "mom_60", "rev_5", "vol_20", "amihud_20", "volu_z_20"]
-
     # 2) filter: enough history per ticker
     panel = panel.sort_values(["ticker", "date"]).copy()
     panel["hist_ok"] = panel.groupby("ticker").cumcount() >= min_hist
@@ -117,11 +192,16 @@ def main():
     panel = preprocess_cross_section(panel, factor_cols=factor_cols, winsor_pct=winsor_pct)
 
     # 5) save
-    os.makedirs("data/processed", exist_ok=True)
-    out_path = "data/processed/panel_factors.parquet"
     panel.to_parquet(out_path, index=False)
 
+    # 6) memory-mapped cube for zero-copy loading in 03/04 and notebooks,
+    #    plus per-date ranks so 03/04 look up RankIC ranks / quantile buckets instead of re-sorting
+    build_dir = write_cube(panel, cube_fields, CUBE_DIR)
+    write_rank_index(build_dir)
+    publish_cube(build_dir, CUBE_DIR)
+
     print(f"[OK] saved: {out_path} | rows={len(panel):,} | tickers={panel['ticker'].nunique()} | dates={panel['date'].nunique()}")
+    print(f"[OK] saved: {CUBE_DIR} (+ rank index) | fields={len(cube_fields)}")
 
 
 if __name__ == "__main__":
@@ -1,22 +1,52 @@
 import os
+import sys
 import yaml
 import numpy as np
 import pandas as pd
-from scipy.stats import spearmanr
+from scipy.stats import rankdata, spearmanr
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.cube import CUBE_DIR, FactorCube, cube_is_current, load_cube  # noqa: E402
+from src.engine import import_polars  # noqa: E402
+from src.ranks import check_rank_source, load_rank_index, qcut_labels, quantile_buckets  # noqa: E402
 
-def daily_ic(df: pd.DataFrame, factor_col: str, y_col: str, rank: bool, min_n: int) -> pd.DataFrame:
+
+def cross_sections(df, factor_col: str, y_col: str):
+    """
+    Yield (date, x, y) numpy arrays per date, tickers in sorted order.
+    Accepts the long panel_factors frame or a FactorCube (rows sliced straight from the memmap).
+    """
+    if isinstance(df, FactorCube):
+        X, Y = df.field(factor_col), df.field(y_col)
+        for i, date in enumerate(df.dates):
+            yield date, X[i], Y[i]
+    else:
+        for date, d in df.groupby("date"):
+            yield date, d[factor_col].to_numpy(dtype=float), d[y_col].to_numpy(dtype=float)
+
+
+def daily_ic(df, factor_col: str, y_col: str, rank: bool, min_n: int, ranks=None) -> pd.DataFrame:
+    """
+    ranks: optional RankIndex (FactorCube input only); RankIC then reuses stored average ranks
+    on dates where they cover exactly the valid names (the label is re-ranked if only the factor
+    matches), and falls back to spearmanr otherwise.
+    """
+    if ranks is not None:
+        check_rank_source(df, ranks)
     out = []
-    for date, d in df.groupby("date"):
-        x = d[factor_col]
-        y = d[y_col]
-        ok = x.notna() & y.notna()
-        if ok.sum() < min_n:
+    for i, (date, x, y) in enumerate(cross_sections(df, factor_col, y_col)):
+        ok = ~np.isnan(x) & ~np.isnan(y)
+        n = ok.sum()
+        if n < min_n:
             continue
-        if rank:
-            ic = spearmanr(x[ok].values, y[ok].values).correlation
+        if rank and ranks is not None and ranks.matches(factor_col, i, n):
+            rx = ranks.average_x2(factor_col)[i][ok] / 2.0
+            ry = ranks.average_x2(y_col)[i][ok] / 2.0 if ranks.matches(y_col, i, n) else rankdata(y[ok])
+            ic = np.corrcoef(np.column_stack((rx, ry)), rowvar=False)[1, 0]  # same call spearmanr makes
+        elif rank:
+            ic = spearmanr(x[ok], y[ok]).correlation
         else:
-            ic = np.corrcoef(x[ok].values, y[ok].values)[0, 1]
+            ic = np.corrcoef(x[ok], y[ok])[0, 1]
         out.append((date, ic))
     return pd.DataFrame(out, columns=["date", "ic"]).sort_values("date")
 
@@ -32,20 +62,25 @@ def ic_summary(ic_df: pd.DataFrame) -> dict:
     return {"mean": m, "std": s, "icir": icir, "tstat": tstat, "n_days": n}
 
 
-def quantile_spread(df: pd.DataFrame, factor_col: str, y_col: str, q: int, min_n: int) -> pd.DataFrame:
+def quantile_spread(df, factor_col: str, y_col: str, q: int, min_n: int, ranks=None) -> pd.DataFrame:
+    """
+    ranks: optional RankIndex (FactorCube input only) to look up quantile buckets instead of sorting.
+    """
+    if ranks is not None:
+        check_rank_source(df, ranks)
     rows = []
-    for date, d in df.groupby("date"):
-        x = d[factor_col]
-        y = d[y_col]
-        ok = x.notna() & y.notna()
-        if ok.sum() < min_n:
+    for i, (date, x, y) in enumerate(cross_sections(df, factor_col, y_col)):
+        ok = ~np.isnan(x) & ~np.isnan(y)
+        n = ok.sum()
+        if n < min_n:
             continue
 
-        dd = pd.DataFrame({"x": x[ok].values, "y": y[ok].values})
-        ranks = dd["x"].rank(method="first")
-
-        # qcut needs at least q samples
-        bins = pd.qcut(ranks, q, labels=False)
+        dd = pd.DataFrame({"x": x[ok], "y": y[ok]})
+        if ranks is not None and ranks.matches(factor_col, i, n):
+            bins = quantile_buckets(ranks.ordinal(factor_col)[i][ok], q)
+        else:
+            # qcut needs at least q samples
+            bins = pd.qcut(dd["x"].rank(method="first"), q, labels=False)
 
         mean_by_bin = dd.groupby(bins)["y"].mean()
         spread = float(mean_by_bin.iloc[-1] - mean_by_bin.iloc[0])
@@ -54,26 +89,134 @@ def quantile_spread(df: pd.DataFrame, factor_col: str, y_col: str, q: int, min_n
     return pd.DataFrame(rows, columns=["date", "top_minus_bottom"]).sort_values("date")
 
 
+# ---------------------------
+# polars backend (lazy, multithreaded)
+# ---------------------------
+def qcut_rank_cutoffs(n_max: int, q: int, n_min: int) -> pd.DataFrame:
+    """
+    For each cross-section size n, the last rank of the bottom bucket and the first rank of the
+    top bucket, taken from pd.qcut on ranks 1..n so bucket edges match quantile_spread exactly.
+    """
+    rows = []
+    for n in range(max(n_min, q), n_max + 1):
+        bins = qcut_labels(n, q)
+        rows.append((n, int((bins == 0).sum()), n - int((bins == q - 1).sum()) + 1))
+    return pd.DataFrame(rows, columns=["n", "bottom_max", "top_min"])
+
+
+def _valid(pl, *cols):
+    ok = pl.lit(True)
+    for c in cols:
+        ok = ok & pl.col(c).is_not_null() & pl.col(c).is_not_nan()
+    return ok
+
+
+def daily_ic_polars(lf, factor_col: str, y_col: str, rank: bool, min_n: int):
+    pl = import_polars()
+    x, y = pl.col(factor_col), pl.col(y_col)
+    if rank:
+        x, y = x.rank("average"), y.rank("average")
+    return (
+        lf.select("date", factor_col, y_col)
+        .filter(_valid(pl, factor_col, y_col))
+        .group_by("date")
+        .agg(pl.len().alias("n"), pl.corr(x, y).alias("ic"))
+        .filter(pl.col("n") >= min_n)
+        .select("date", "ic")
+        .sort("date")
+    )
+
+
+def quantile_spread_polars(lf, factor_col: str, y_col: str, cutoffs, min_n: int):
+    pl = import_polars()
+    y = pl.col(y_col)
+    return (
+        lf.select("date", factor_col, y_col)
+        .filter(_valid(pl, factor_col, y_col))
+        .with_columns(
+            pl.len().over("date").cast(pl.Int64).alias("n"),
+            pl.col(factor_col).rank("ordinal").over("date").alias("r"),
+        )
+        .filter(pl.col("n") >= min_n)
+        .join(cutoffs, on="n")
+        .group_by("date")
+        .agg(
+            (y.filter(pl.col("r") >= pl.col("top_min")).mean()
+             - y.filter(pl.col("r") <= pl.col("bottom_max")).mean()).alias("top_minus_bottom")
+        )
+        .sort("date")
+    )
+
+
+def evaluate_polars(in_path: str, factors, horizons, q: int, min_n_ic: int, min_n_spread: int, n_tickers: int) -> dict:
+    """
+    Build IC / RankIC / quantile-spread plans for every (factor, h) over one parquet scan and run
+    them together; returns {(factor, h): (ic_df, ric_df, spread_df)} as pandas frames.
+    """
+    pl = import_polars()
+    lf = pl.scan_parquet(in_path)
+    cutoffs = pl.from_pandas(qcut_rank_cutoffs(n_tickers, q, min_n_spread)).lazy()
+
+    keys, plans = [], []
+    for fac in factors:
+        for h in horizons:
+            ycol = f"fwd_ret_{h}d"
+            keys.append((fac, h))
+            plans += [
+                daily_ic_polars(lf, fac, ycol, rank=False, min_n=min_n_ic),
+                daily_ic_polars(lf, fac, ycol, rank=True, min_n=min_n_ic),
+                quantile_spread_polars(lf, fac, ycol, cutoffs, min_n=min_n_spread),
+            ]
+
+    frames = [f.to_pandas() for f in pl.collect_all(plans)]
+    return {k: tuple(frames[3 * i:3 * i + 3]) for i, k in enumerate(keys)}
+
+
 def main():
     with open("config.yaml", "r") as f:
         cfg = yaml.safe_load(f)
 
     horizons = cfg["research"]["horizons"]
     q = int(cfg["research"]["quantiles"])
+    backend = cfg.get("engine", {}).get("backend", "pandas")
+    if backend not in ("pandas", "polars"):
+        raise ValueError(f"Unknown engine.backend={backend!r}; expected 'pandas' or 'polars'.")
 
     in_path = "data/processed/panel_factors.parquet"
-    if not os.path.exists(in_path):
+    if backend == "polars":
+        if not os.path.exists(in_path):
+            raise FileNotFoundError(f"Missing {in_path}. Run scripts/02_preprocess.py first.")
+        pl = import_polars()
+        df = None
+        n_tickers = pl.scan_parquet(in_path).select(pl.col("ticker").n_unique()).collect().item()
+    elif cube_is_current(in_path, CUBE_DIR):
+        # zero-copy: per-date rows are sliced from the shared memory-mapped cube
+        df = load_cube(CUBE_DIR)
+        n_tickers = len(df.tickers)
+    elif os.path.exists(in_path):
+        if os.path.exists(CUBE_DIR):
+            print(f"[WARN] {CUBE_DIR} is older than {in_path}; reading the parquet. Re-run scripts/02_preprocess.py.")
+        df = pd.read_parquet(in_path)
+        n_tickers = df["ticker"].nunique()
+    else:
         raise FileNotFoundError(f"Missing {in_path}. Run scripts/02_preprocess.py first.")
-    df = pd.read_parquet(in_path)
+
+    # per-date ranks persisted by 02 (only usable together with the cube)
+    ranks = load_rank_index(df) if isinstance(df, FactorCube) else None
+    if isinstance(df, FactorCube) and ranks is None:
+        print(f"[WARN] rank index in {CUBE_DIR} is missing or stale; sorting per date.")
 
     # ---- KEY FIX: adapt thresholds to your universe size ----
     # For IC: need enough cross-sectional names; with 10 tickers, set ~8-10.
-    min_n_ic = max(8, min(30, df["ticker"].nunique()))
+    min_n_ic = max(8, min(30, n_tickers))
     # For quantile spread: must have >= q, plus a little slack
     min_n_spread = max(q, min_n_ic)
 
     factors = ["mom_20", "mom_60", "rev_5", "vol_20", "amihud_20", "volu_z_20"]
 
+    if backend == "polars":
+        precomputed = evaluate_polars(in_path, factors, horizons, q, min_n_ic, min_n_spread, n_tickers)
+
     os.makedirs("results", exist_ok=True)
 
     summary_rows = []
@@ -84,8 +227,12 @@ def main():
         for h in horizons:
             ycol = f"fwd_ret_{h}d"
 
-            ic_df = daily_ic(df, fac, ycol, rank=False, min_n=min_n_ic)
-            ric_df = daily_ic(df, fac, ycol, rank=True, min_n=min_n_ic)
+            if backend == "polars":
+                ic_df, ric_df, sp = precomputed[(fac, h)]
+            else:
+                ic_df = daily_ic(df, fac, ycol, rank=False, min_n=min_n_ic)
+                ric_df = daily_ic(df, fac, ycol, rank=True, min_n=min_n_ic, ranks=ranks)
+                sp = quantile_spread(df, fac, ycol, q=q, min_n=min_n_spread, ranks=ranks)
 
             s_ic = ic_summary(ic_df)
             s_ric = ic_summary(ric_df)
@@ -105,7 +252,6 @@ def main():
                 "n_days": s_ric["n_days"],
             })
 
-            sp = quantile_spread(df, fac, ycol, q=q, min_n=min_n_spread)
             sp["factor"] = fac
             sp["h"] = h
             spread_rows.append(sp)
@@ -115,7 +261,7 @@ def main():
     pd.concat(spread_rows, ignore_index=True).to_csv("results/quantile_spread.csv", index=False)
 
     print("[OK] wrote results/ic_summary.csv, results/decay_curve.csv, results/quantile_spread.csv")
-    print(f"[INFO] thresholds: min_n_ic={min_n_ic}, min_n_spread={min_n_spread}, tickers={df['ticker'].nunique()}")
+    print(f"[INFO] thresholds: min_n_ic={min_n_ic}, min_n_spread={min_n_spread}, tickers={n_tickers} | backend={backend}")
 
 
 if __name__ == "__main__":
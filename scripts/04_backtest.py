@@ -1,16 +1,25 @@
 import os
+import sys
 import yaml
 import numpy as np
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.cube import CUBE_DIR, FactorCube, cube_is_current, load_cube  # noqa: E402
+from src.ranks import check_rank_source, load_rank_index, quantile_buckets  # noqa: E402
 
-def build_weights(dd: pd.DataFrame, factor_col: str, q: int) -> pd.Series:
+
+def build_weights(dd: pd.DataFrame, factor_col: str, q: int, ordinal=None) -> pd.Series:
     """
     Long top quantile, short bottom quantile, equal weight within each side.
+    ordinal: optional precomputed ordinal ranks of dd[factor_col] (rows of dd, no NaN), skips the sort.
     """
     dd = dd.dropna(subset=[factor_col]).copy()
-    ranks = dd[factor_col].rank(method="first")
-    bins = pd.qcut(ranks, q, labels=False)  # 0...(q-1)
+    if ordinal is not None:
+        bins = quantile_buckets(ordinal, q)
+    else:
+        ranks = dd[factor_col].rank(method="first")
+        bins = pd.qcut(ranks, q, labels=False)  # 0...(q-1)
 
     long_names = dd.loc[bins == (q - 1), "ticker"].tolist()
     short_names = dd.loc[bins == 0, "ticker"].tolist()
@@ -32,24 +41,37 @@ def turnover(prev_w: pd.Series, new_w: pd.Series) -> float:
     return float((n - p).abs().sum() / 2.0)
 
 
-def step_backtest_5d(df: pd.DataFrame, factor_col: str, q: int, cost_bps_roundtrip: float) -> pd.DataFrame:
+def cross_section(df, dt, cols) -> pd.DataFrame:
+    """
+    (ticker, *cols) rows for one date, from the long panel_factors frame or a FactorCube.
+    """
+    if isinstance(df, FactorCube):
+        i = df.dates.get_loc(dt)
+        return pd.DataFrame({"ticker": df.tickers, **{c: df.field(c)[i] for c in cols}})
+    return df.loc[df["date"] == dt, ["ticker", *cols]]
+
+
+def step_backtest_5d(df, factor_col: str, q: int, cost_bps_roundtrip: float, ranks=None) -> pd.DataFrame:
     """
     Step backtest aligned to 5-day horizon:
       - rebalance every 5 trading days
       - portfolio return = sum_i w_i * fwd_ret_5d(i,t) on rebalance date t
       - cost charged only on rebalance days
+      - ranks: optional RankIndex (FactorCube input only) to look up quantile buckets
 
     Output rows are "rebalance dates" only (one row per 5 trading days).
     """
+    if ranks is not None:
+        check_rank_source(df, ranks)
     out = []
     prev_w = None
 
-    dates = sorted(df["date"].unique())
+    dates = list(df.dates) if isinstance(df, FactorCube) else sorted(df["date"].unique())
     # take every 5th date as rebalance date
     reb_dates = dates[::5]
 
     for dt in reb_dates:
-        d = df[df["date"] == dt].copy()
+        d = cross_section(df, dt, [factor_col, "fwd_ret_5d"])
 
         # require factor and fwd_ret_5d
         ok = d[factor_col].notna() & d["fwd_ret_5d"].notna()
@@ -57,7 +79,13 @@ def step_backtest_5d(df: pd.DataFrame, factor_col: str, q: int, cost_bps_roundtr
         if len(d) < max(q, 30):  # with 130 tickers this is fine
             continue
 
-        w = build_weights(d[["ticker", factor_col]], factor_col=factor_col, q=q)
+        ordinal = None
+        if ranks is not None:
+            i = df.dates.get_loc(dt)
+            if ranks.matches(factor_col, i, len(d)):
+                ordinal = ranks.ordinal(factor_col)[i][ok.to_numpy()]
+
+        w = build_weights(d[["ticker", factor_col]], factor_col=factor_col, q=q, ordinal=ordinal)
         y = d.set_index("ticker")["fwd_ret_5d"]
 
         gross_ret = float((w.reindex(y.index).fillna(0.0) * y).sum())
@@ -103,13 +131,23 @@ def main():
     cost_bps = float(cfg["research"]["cost_bps_roundtrip"])
 
     in_path = "data/processed/panel_factors.parquet"
-    if not os.path.exists(in_path):
+    ranks = None
+    if cube_is_current(in_path, CUBE_DIR):
+        # zero-copy: rebalance-date rows are sliced from the shared memory-mapped cube
+        df = load_cube(CUBE_DIR)
+        ranks = load_rank_index(df)
+        if ranks is None:
+            print(f"[WARN] rank index in {CUBE_DIR} is missing or stale; sorting per date.")
+    elif os.path.exists(in_path):
+        if os.path.exists(CUBE_DIR):
+            print(f"[WARN] {CUBE_DIR} is older than {in_path}; reading the parquet. Re-run scripts/02_preprocess.py.")
+        df = pd.read_parquet(in_path).sort_values(["date", "ticker"])
+    else:
         raise FileNotFoundError(f"Missing {in_path}. Run scripts/02_preprocess.py first.")
-    df = pd.read_parquet(in_path).sort_values(["date", "ticker"])
 
     factor = "rev_5"  # main factor
 
-    bt = step_backtest_5d(df, factor_col=factor, q=q, cost_bps_roundtrip=cost_bps)
+    bt = step_backtest_5d(df, factor_col=factor, q=q, cost_bps_roundtrip=cost_bps, ranks=ranks)
     if bt.empty:
         raise RuntimeError("Step backtest produced 0 rows. Check factor/label availability.")
 
@@ -0,0 +1,123 @@
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+
+
+# ---------------------------
+# memory-mapped factor cube
+# ---------------------------
+# Each build lives in its own immutable directory <cube_dir>.builds/<build_id>/:
+#   values.npy    float64 (fields, dates, tickers); missing (date, ticker) rows are NaN
+#   dates.npy     datetime64[ns] (dates,)
+#   tickers.npy   unicode (tickers,)
+#   fields.npy    unicode (fields,)
+#   build_id.txt  id of this build
+# and <cube_dir> is a symlink to the current build, swapped atomically by publish_cube.
+# A reader resolves the symlink once, so it never mixes files from two builds.
+# Each field is one contiguous dates x tickers block, so cube.field(name) is a zero-copy
+# view into the page cache, shared by every process that opens the same files.
+
+CUBE_DIR = "data/processed/cube"
+KEEP_BUILDS = 2  # current + previous, for readers still opening the old build
+
+
+def write_cube(panel: pd.DataFrame, fields, out_dir: str = CUBE_DIR) -> str:
+    """
+    Pivot a long (date, ticker, ...) panel into a new, unpublished build directory and return it.
+    Add any sidecars (e.g. the rank index) to that directory, then call publish_cube.
+    """
+    build_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    build_dir = os.path.join(f"{out_dir}.builds", build_id)
+    os.makedirs(build_dir)
+
+    dates = pd.DatetimeIndex(np.sort(panel["date"].unique())).astype("datetime64[ns]")
+    tickers = pd.Index(np.sort(panel["ticker"].unique()))
+    di = dates.get_indexer(panel["date"])
+    ti = tickers.get_indexer(panel["ticker"])
+
+    values = np.lib.format.open_memmap(
+        os.path.join(build_dir, "values.npy"), mode="w+", dtype=np.float64, shape=(len(fields), len(dates), len(tickers))
+    )
+    values[:] = np.nan
+    for k, col in enumerate(fields):
+        values[k, di, ti] = panel[col].to_numpy(dtype=np.float64, na_value=np.nan)
+    values.flush()
+    del values
+
+    np.save(os.path.join(build_dir, "dates.npy"), dates.values)
+    np.save(os.path.join(build_dir, "tickers.npy"), tickers.to_numpy(dtype=str))
+    np.save(os.path.join(build_dir, "fields.npy"), np.asarray(fields, dtype=str))
+    with open(os.path.join(build_dir, "build_id.txt"), "w") as f:
+        f.write(build_id)
+    return build_dir
+
+
+def publish_cube(build_dir: str, out_dir: str = CUBE_DIR):
+    """
+    Atomically point out_dir at build_dir and prune builds older than the previous one.
+    """
+    if os.path.isdir(out_dir) and not os.path.islink(out_dir):
+        shutil.rmtree(out_dir)  # cube written before builds were versioned
+
+    target = os.path.relpath(build_dir, os.path.dirname(os.path.abspath(out_dir)))
+    tmp = f"{out_dir}.tmp-{os.getpid()}"
+    os.symlink(target, tmp)
+    os.replace(tmp, out_dir)
+
+    builds_root = os.path.dirname(os.path.abspath(build_dir))
+    current = os.path.basename(build_dir)
+    for name in sorted(os.listdir(builds_root))[:-KEEP_BUILDS]:
+        if name != current:
+            shutil.rmtree(os.path.join(builds_root, name), ignore_errors=True)
+
+
+class FactorCube:
+    """
+    Read-only, memory-mapped view of a cube written by write_cube.
+
+        cube = load_cube()
+        x = cube.field("rev_5")          # (dates, tickers) np.memmap view, no copy
+        y = cube.frame("fwd_ret_5d")     # same data as a wide DataFrame
+    """
+
+    def __init__(self, path: str = CUBE_DIR):
+        # resolve the symlink once: every file below comes from the same build
+        self.path = path = os.path.realpath(path)
+        self.values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        self.dates = pd.DatetimeIndex(np.load(os.path.join(path, "dates.npy")), name="date")
+        self.tickers = pd.Index(np.load(os.path.join(path, "tickers.npy")).astype(object), name="ticker")
+        self.fields = [str(f) for f in np.load(os.path.join(path, "fields.npy"))]
+        with open(os.path.join(path, "build_id.txt")) as f:
+            self.build_id = f.read().strip()
+        self._pos = {f: k for k, f in enumerate(self.fields)}
+
+        axes = (len(self.fields), len(self.dates), len(self.tickers))
+        if self.values.shape != axes:
+            raise ValueError(f"Corrupt cube at {path}: values.shape={self.values.shape} but (fields, dates, tickers)={axes}")
+
+    def field(self, name: str) -> np.ndarray:
+        if name not in self._pos:
+            raise KeyError(f"{name!r} not in cube fields {self.fields}")
+        return self.values[self._pos[name]]
+
+    def frame(self, name: str) -> pd.DataFrame:
+        return pd.DataFrame(self.field(name), index=self.dates, columns=self.tickers, copy=False)
+
+
+def cube_is_current(parquet_path: str, path: str = CUBE_DIR) -> bool:
+    """
+    True if a published cube exists and is not older than parquet_path (or parquet_path is absent).
+    02 writes the cube after the parquet, so an older cube means the parquet was rebuilt without it.
+    """
+    values = os.path.join(path, "values.npy")
+    if not os.path.exists(values):
+        return False
+    return not os.path.exists(parquet_path) or os.path.getmtime(values) >= os.path.getmtime(parquet_path)
+
+
+def load_cube(path: str = CUBE_DIR) -> FactorCube:
+    if not os.path.exists(os.path.join(path, "values.npy")):
+        raise FileNotFoundError(f"Missing {path}/values.npy. Run scripts/02_preprocess.py first.")
+    return FactorCube(path)
@@ -0,0 +1,22 @@
+import re
+
+
+# ---------------------------
+# optional polars backend (engine.backend: "polars")
+# ---------------------------
+# rolling_*(min_samples=...) used by the polars path was introduced in polars 1.21.
+MIN_POLARS = (1, 21)
+
+
+def import_polars():
+    try:
+        import polars as pl
+    except ImportError as e:
+        raise ImportError("engine.backend='polars' requires polars>=1.21: pip install 'polars>=1.21'") from e
+
+    version = tuple(int(p) for p in re.findall(r"\d+", pl.__version__)[:2])
+    if version < MIN_POLARS:
+        raise ImportError(
+            f"engine.backend='polars' requires polars>=1.21, found {pl.__version__}: pip install -U 'polars>=1.21'"
+        )
+    return pl
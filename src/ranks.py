@@ -0,0 +1,152 @@
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+from src.cube import FactorCube
+
+
+# ---------------------------
+# per-date rank index over the factor cube
+# ---------------------------
+# Written into the cube build directory (before publish_cube):
+#   rank_ordinal.npy  int (fields, dates, tickers)  ranks 1..n, ties by ticker order (= rank(method="first"))
+#   rank_avg_x2.npy   int (fields, dates, tickers)  2 x average-tie rank (= rankdata / spearmanr ranks)
+#   rank_count.npy    int (fields, dates)           number of non-NaN names n
+#   rank_build_id.txt build_id of the cube the ranks were computed from
+# 0 marks NaN. Ranks are over all non-NaN names of that field on that date, so a consumer may
+# only reuse them when its own valid set has the same size (see RankIndex.matches).
+
+
+def _rank_dtype(n_tickers: int):
+    return np.int16 if 2 * n_tickers <= np.iinfo(np.int16).max else np.int32
+
+
+def write_rank_index(cube_dir: str):
+    """
+    Sort every field once per date and persist ordinal / average ranks and valid counts.
+    cube_dir is an unpublished build directory from write_cube.
+    """
+    values = np.load(os.path.join(cube_dir, "values.npy"), mmap_mode="r")
+    n_fields, n_dates, n_tickers = values.shape
+    dtype = _rank_dtype(n_tickers)
+
+    def out(name, shape):
+        return np.lib.format.open_memmap(os.path.join(cube_dir, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+    ordinal = out("rank_ordinal", values.shape)
+    avg_x2 = out("rank_avg_x2", values.shape)
+    count = out("rank_count", (n_fields, n_dates))
+
+    for k in range(n_fields):
+        for i in range(n_dates):
+            v = values[k, i]
+            ok = ~np.isnan(v)
+            o = np.zeros(n_tickers, dtype=dtype)
+            a = np.zeros(n_tickers, dtype=dtype)
+            if ok.any():
+                o[ok] = rankdata(v[ok], method="ordinal")
+                a[ok] = (2 * rankdata(v[ok], method="average")).astype(dtype)
+            ordinal[k, i] = o
+            avg_x2[k, i] = a
+            count[k, i] = ok.sum()
+
+    for arr in (ordinal, avg_x2, count):
+        arr.flush()
+
+    # written last: an interrupted run leaves no fingerprint and the index is ignored
+    with open(os.path.join(cube_dir, "build_id.txt")) as f:
+        build_id = f.read().strip()
+    with open(os.path.join(cube_dir, "rank_build_id.txt"), "w") as f:
+        f.write(build_id)
+
+
+class RankIndex:
+    """
+    Read-only, memory-mapped rank index for the fields of a FactorCube (same date/ticker axes).
+
+        ranks = load_rank_index(cube)
+        i = cube.dates.get_loc(dt)
+        if ranks is not None and ranks.matches("rev_5", i, n):
+            buckets = quantile_buckets(ranks.ordinal("rev_5")[i][ok], q)
+    """
+
+    def __init__(self, cube: FactorCube):
+        path = cube.path  # resolved build directory, same files the cube was opened from
+        self.path = path
+        with open(os.path.join(path, "rank_build_id.txt")) as f:
+            self.build_id = f.read().strip()
+        self.fields = list(cube.fields)
+        self._pos = {f: k for k, f in enumerate(self.fields)}
+        self._ordinal = np.load(os.path.join(path, "rank_ordinal.npy"), mmap_mode="r")
+        self._avg_x2 = np.load(os.path.join(path, "rank_avg_x2.npy"), mmap_mode="r")
+        self._count = np.load(os.path.join(path, "rank_count.npy"), mmap_mode="r")
+
+    def is_for(self, cube: FactorCube) -> bool:
+        """True if the index was computed from exactly this cube build (fingerprint and axes)."""
+        return (
+            self.build_id == cube.build_id
+            and self._ordinal.shape == cube.values.shape
+            and self._avg_x2.shape == cube.values.shape
+            and self._count.shape == cube.values.shape[:2]
+        )
+
+    def _k(self, name: str) -> int:
+        if name not in self._pos:
+            raise KeyError(f"{name!r} not in rank index fields {self.fields}")
+        return self._pos[name]
+
+    def ordinal(self, name: str) -> np.ndarray:
+        return self._ordinal[self._k(name)]
+
+    def average_x2(self, name: str) -> np.ndarray:
+        return self._avg_x2[self._k(name)]
+
+    def count(self, name: str) -> np.ndarray:
+        return self._count[self._k(name)]
+
+    def matches(self, name: str, i: int, n: int) -> bool:
+        """True if stored ranks on date i cover exactly n names, i.e. they equal ranks over a valid subset of size n."""
+        return int(self._count[self._k(name), i]) == n
+
+
+def check_rank_source(df, ranks: RankIndex):
+    """
+    Rank lookups index rows by cube date position, so ranks only apply to the cube they were built for.
+    """
+    if not isinstance(df, FactorCube):
+        raise TypeError("ranks= requires the FactorCube it was built for, not a long DataFrame")
+    if not ranks.is_for(df):
+        raise ValueError(f"rank index build {ranks.build_id} does not match cube build {df.build_id}")
+
+
+def load_rank_index(cube: FactorCube):
+    """
+    RankIndex for this cube build, or None if it is missing or was computed from a different
+    build (callers then sort per date).
+    """
+    if not os.path.exists(os.path.join(cube.path, "rank_build_id.txt")):
+        return None
+    ranks = RankIndex(cube)
+    return ranks if ranks.is_for(cube) else None
+
+
+# ---------------------------
+# quantile buckets from ordinal ranks
+# ---------------------------
+@lru_cache(maxsize=None)
+def qcut_labels(n: int, q: int) -> np.ndarray:
+    """
+    pd.qcut(ranks 1..n, q, labels=False); bucket of ordinal rank r is qcut_labels(n, q)[r - 1].
+    """
+    labels = pd.qcut(pd.Series(np.arange(1, n + 1, dtype=float)), q, labels=False).to_numpy()
+    labels.flags.writeable = False
+    return labels
+
+
+def quantile_buckets(ordinal: np.ndarray, q: int) -> np.ndarray:
+    """
+    Same buckets as pd.qcut(x.rank(method="first"), q, labels=False) for ordinal ranks 1..n of x.
+    """
+    return qcut_labels(len(ordinal), q)[np.asarray(ordinal, dtype=np.int64) - 1]